@@ -1,15 +1,38 @@
+import functools
+import http.client
 import json
 import os
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import queue
+import re
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse
-from datetime import datetime
-from urllib import request as urllib_request, error as urllib_error
 from pathlib import Path
 
+try:
+  import orjson
+except ImportError:
+  # orjson is optional; without it we fall back to the stdlib json module.
+  orjson = None
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
 #
+# One `KEY=VALUE` assignment per line. The value may be double- or
+# single-quoted, optionally followed by a `# comment`; an optional leading
+# `export ` is accepted, as in shell files. Comment lines never match because
+# they do not start with a name.
+ENV_LINE_RE = re.compile(
+  r"""^[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*"""
+  r"""(?:"([^"\n]*)"(?:[ \t]+#.*)?|'([^'\n]*)'(?:[ \t]+#.*)?|(.*?))[ \t]*$""",
+  re.MULTILINE,
+)
+
+
 def load_dotenv(path: str = ".env") -> None:
   """
   Very small .env loader: KEY=VALUE per line, # for comments.
@@ -19,17 +42,12 @@ def load_dotenv(path: str = ".env") -> None:
   if not env_path.is_file():
     return
 
-  for raw_line in env_path.read_text(encoding="utf-8").splitlines():
-    line = raw_line.strip()
-    if not line or line.startswith("#"):
-      continue
-    if "=" not in line:
-      continue
-    key, value = line.split("=", 1)
-    key = key.strip()
-    value = value.strip().strip('"').strip("'")
-    if key and key not in os.environ:
-      os.environ[key] = value
+  for match in ENV_LINE_RE.finditer(env_path.read_text(encoding="utf-8")):
+    key, double_quoted, single_quoted, bare = match.groups()
+    if double_quoted is None and single_quoted is None:
+      # Stray quotes around an unquoted value (e.g. `KEY="value`) are stripped.
+      bare = bare.strip('"').strip("'")
+    os.environ.setdefault(key, double_quoted or single_quoted or bare or "")
 
 
 # Load environment variables from .env (if present) before reading config.
@@ -46,6 +64,34 @@ VAULT_MARKDOWN_PATH = os.environ.get("VAULT_MARKDOWN_PATH", "")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
 
+# Tagging mode: "ai" (Gemini), "rule" (keyword rules only) or "off" (no tags).
+# Defaults to "ai" when a Gemini key is configured, otherwise "rule".
+TAGS_MODE = (os.environ.get("TABVAULT_TAGS") or ("ai" if GEMINI_API_KEY else "rule")).strip().lower()
+
+# Largest request body the helper will read into memory; bigger uploads get a 413.
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Most items accepted in one request; bigger batches get a 413.
+MAX_ITEMS_PER_REQUEST = 5000
+
+
+def json_loads(data: bytes):
+  """
+  Parse a JSON document from raw bytes, using orjson when it is installed.
+  """
+  if orjson is not None:
+    return orjson.loads(data)
+  return json.loads(data.decode("utf-8"))
+
+
+def json_dumps(payload) -> bytes:
+  """
+  Serialize a payload to UTF-8 encoded JSON bytes, using orjson when it is installed.
+  """
+  if orjson is not None:
+    return orjson.dumps(payload)
+  return json.dumps(payload).encode("utf-8")
+
 
 def ensure_file_exists():
   if not VAULT_MARKDOWN_PATH:
@@ -58,60 +104,181 @@ def ensure_file_exists():
       f.write("# Watch Later\n\n")
 
 
+# Timestamps are formatted through caches keyed by coarse time buckets, since
+# the items of one request almost always share a day. Every real-world UTC
+# offset (DST included) is a multiple of 15 minutes, so all timestamps in a
+# quarter-hour bucket fall on the same local date.
+MS_PER_QUARTER_HOUR = 15 * 60 * 1000
+MS_PER_MINUTE = 60 * 1000
+
+
+@functools.lru_cache(maxsize=1024)
+def _date_for_quarter_hour(bucket: int) -> str:
+  return time.strftime("%Y-%m-%d", time.localtime(bucket * MS_PER_QUARTER_HOUR / 1000.0))
+
+
+@functools.lru_cache(maxsize=1024)
+def _time_for_minute(bucket: int) -> str:
+  return time.strftime("%H:%M", time.localtime(bucket * MS_PER_MINUTE / 1000.0))
+
+
 def format_date_iso(ms: int) -> str:
-  dt = datetime.fromtimestamp(ms / 1000.0)
-  return dt.strftime("%Y-%m-%d")
+  return _date_for_quarter_hour(ms // MS_PER_QUARTER_HOUR)
 
 
 def format_time_hm(ms: int) -> str:
-  dt = datetime.fromtimestamp(ms / 1000.0)
-  return dt.strftime("%H:%M")
+  return _time_for_minute(ms // MS_PER_MINUTE)
 
 
 def escape_markdown_link_text(text: str) -> str:
   return text.replace("[", "\\[").replace("]", "\\]")
 
 
+# Keywords (matched against the lowercased title + URL) for each rule-based tag.
+# Each tag's keywords are compiled into one alternation, so the text is
+# scanned once per tag by the regex engine instead of once per keyword.
+RULE_TAG_KEYWORDS = {
+  "video": ("youtube.com", "vimeo.com", "watch?v=", "playlist?"),
+  "deep_read": ("paper", "arxiv.org", "researchgate.net", "whitepaper"),
+  "article": ("blog", "dev.to", "medium.com", "hashnode.com"),
+  "docs": ("docs", "documentation", "manual", "reference"),
+  "learning": ("course", "tutorial", "learn", "guide"),
+  "code": ("github.com", "gitlab.com", "bitbucket.org"),
+}
+
+RULE_TAG_PATTERNS = {
+  tag: re.compile("|".join(re.escape(word) for word in words))
+  for tag, words in RULE_TAG_KEYWORDS.items()
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _rule_based_tags(title: str, url: str) -> tuple[str, ...]:
+  # Cached as a tuple so a caller can never mutate the shared cached value.
+  text = f"{title} {url}".lower()
+  # Tags are the dict keys, so the result is already unique and ordered.
+  return tuple(tag for tag, pattern in RULE_TAG_PATTERNS.items() if pattern.search(text))
+
+
 def classify_tags_rule_based(title: str, url: str) -> list[str]:
   """
   Lightweight auto-tagging based on title/URL.
   This is intentionally simple and rules-based but structured so you can
   replace it with a real AI model call later if you want to.
   """
-  text = f"{title} {url}".lower()
-  tags: list[str] = []
-
-  if any(word in text for word in ("youtube.com", "vimeo.com", "watch?v=", "playlist?")):
-    tags.append("video")
-  if any(word in text for word in ("paper", "arxiv.org", "researchgate.net", "whitepaper")):
-    tags.append("deep_read")
-  if any(word in text for word in ("blog", "dev.to", "medium.com", "hashnode.com")):
-    tags.append("article")
-  if any(word in text for word in ("docs", "documentation", "manual", "reference")):
-    tags.append("docs")
-  if any(word in text for word in ("course", "tutorial", "learn", "guide")):
-    tags.append("learning")
-  if any(word in text for word in ("github.com", "gitlab.com", "bitbucket.org")):
-    tags.append("code")
-
-  # De-duplicate while preserving order.
+  return list(_rule_based_tags(title, url))
+
+
+def classify_tags_rule_based_batch(pairs: list[tuple[str, str]]) -> list[list[str]]:
+  return [classify_tags_rule_based(title, url) for title, url in pairs]
+
+
+GEMINI_HOST = "generativelanguage.googleapis.com"
+
+# Errors a Gemini call can raise; callers catch these and fall back to rule-based tags.
+GEMINI_ERRORS = (OSError, http.client.HTTPException, ValueError, KeyError)
+
+# Upper bound on concurrent single-entry Gemini calls made by one batch.
+GEMINI_MAX_WORKERS = 8
+
+# Idle keep-alive connections to Gemini, so consecutive calls skip the TCP/TLS
+# handshake. A queue instead of a single shared connection lets concurrent
+# requests each use their own connection; it holds at most one connection per
+# batch worker, and extra connections are closed instead of kept.
+_GEMINI_CONNECTIONS: "queue.LifoQueue[http.client.HTTPSConnection]" = queue.LifoQueue(maxsize=GEMINI_MAX_WORKERS)
+
+
+def gemini_generate_text(prompt: str) -> str:
+  """
+  Send a single prompt to Gemini and return the text of the first candidate
+  ("" if the response has none). Network and decoding errors propagate.
+  """
+  body = {
+    "contents": [
+      {
+        "parts": [
+          {
+            "text": prompt
+          }
+        ]
+      }
+    ]
+  }
+
+  path = f"/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+  data = json_dumps(body)
+
+  for attempt in range(2):
+    reused = False
+    if attempt == 0:
+      try:
+        conn = _GEMINI_CONNECTIONS.get_nowait()
+        reused = True
+      except queue.Empty:
+        pass
+    if not reused:
+      # The retry always opens a new connection: other pooled connections
+      # may have gone idle and been dropped by the server as well.
+      conn = http.client.HTTPSConnection(GEMINI_HOST, timeout=10)
+    try:
+      conn.request("POST", path, body=data, headers={"Content-Type": "application/json"})
+      resp = conn.getresponse()
+      resp_body = resp.read()
+    except TimeoutError:
+      conn.close()
+      raise
+    except (OSError, http.client.HTTPException):
+      conn.close()
+      # The server may have dropped an idle connection; retry once on a fresh one.
+      if reused and attempt == 0:
+        continue
+      raise
+    break
+
+  # The response was read completely, so the connection can serve the next call.
+  try:
+    _GEMINI_CONNECTIONS.put_nowait(conn)
+  except queue.Full:
+    conn.close()
+  if resp.status != 200:
+    raise http.client.HTTPException(f"Gemini returned HTTP {resp.status}")
+
+  parsed = json_loads(resp_body)
+  candidates = parsed.get("candidates") or []
+  if not candidates:
+    return ""
+  content = candidates[0].get("content") or {}
+  parts = content.get("parts") or []
+  if not parts:
+    return ""
+  return parts[0].get("text") or ""
+
+
+def parse_tags(text: str) -> list[str]:
+  """
+  Turn a line of space-separated tags from the model into a clean,
+  de-duplicated list of lowercase tags without '#'.
+  """
+  # Split on whitespace and normalise.
+  tags = [t.strip().lower().lstrip("#") for t in text.split() if t.strip()]
+  # Deduplicate.
   seen = set()
-  unique_tags = []
+  result = []
   for t in tags:
-    if t not in seen:
+    if t and t not in seen:
       seen.add(t)
-      unique_tags.append(t)
-  return unique_tags
+      result.append(t)
+  return result
 
 
-def classify_tags_ai(title: str, url: str) -> list[str]:
+@functools.lru_cache(maxsize=4096)
+def classify_tags_gemini(title: str, url: str) -> tuple[str, ...]:
   """
-  Classify using Gemini if GEMINI_API_KEY is set; otherwise fall back to rule-based tags.
-  The model is expected to return a single line of space-separated tags, no '#'.
+  Ask Gemini for the tags of a single page. Raises on network errors or an
+  empty answer, so only successful answers end up in the cache and the same
+  tab closed again later does not cost another request. Returns a tuple
+  because the cached value is shared between callers.
   """
-  if not GEMINI_API_KEY:
-    return classify_tags_rule_based(title, url)
-
   prompt = (
     "You are a short tag generator for a personal knowledge base.\n"
     "Given a web page title and URL, return 3-6 short, lowercase tags that describe its topic or type.\n"
@@ -124,140 +291,348 @@ def classify_tags_ai(title: str, url: str) -> list[str]:
     "Tags:"
   )
 
-  body = {
-    "contents": [
-      {
-        "parts": [
-          {
-            "text": prompt
-          }
-        ]
-      }
-    ]
-  }
+  result = parse_tags(gemini_generate_text(prompt))
+  if not result:
+    raise ValueError("Gemini returned no tags")
+  return tuple(result)
+
+
+def classify_tags_ai(title: str, url: str) -> list[str]:
+  """
+  Classify using Gemini if GEMINI_API_KEY is set; otherwise fall back to rule-based tags.
+  The model is expected to return a single line of space-separated tags, no '#'.
+  """
+  if not GEMINI_API_KEY:
+    return classify_tags_rule_based(title, url)
+
+  try:
+    return list(classify_tags_gemini(title, url))
+  except GEMINI_ERRORS:
+    # On any failure (including an empty answer), silently fall back to simple rules.
+    return classify_tags_rule_based(title, url)
 
-  url_endpoint = (
-    f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-    f"?key={GEMINI_API_KEY}"
+
+BATCH_LINE_RE = re.compile(r"^\s*(\d+)\s*[.:)]\s*(.*)$")
+
+
+def classify_tags_ai_batch(pairs: list[tuple[str, str]]) -> list[list[str]]:
+  """
+  Classify several (title, url) pairs with a single Gemini request.
+  The model answers with one numbered line of tags per entry; entries it
+  skipped or left empty are classified individually, and everything falls
+  back to rule-based tags if the request fails.
+  """
+  if not GEMINI_API_KEY:
+    return classify_tags_rule_based_batch(pairs)
+  if len(pairs) == 1:
+    return [classify_tags_ai(*pairs[0])]
+
+  entries = "".join(
+    f"{n}. Title: {title}\n   URL: {url}\n" for n, (title, url) in enumerate(pairs, start=1)
+  )
+  prompt = (
+    "You are a short tag generator for a personal knowledge base.\n"
+    "For each numbered web page below (title and URL), return 3-6 short, lowercase tags that describe its topic or type.\n"
+    "Rules:\n"
+    "- Output exactly one line per entry, in the same order, formatted as '<number>: <tags>'.\n"
+    "- Tags are space-separated on that single line.\n"
+    "- Do NOT include '#' characters.\n"
+    "- Prefer generic topics like ai, frontend, philosophy, productivity, health, video, deep_read, article, docs, code.\n\n"
+    f"{entries}\n"
+    "Tags:"
   )
 
   try:
-    data = json.dumps(body).encode("utf-8")
-    req = urllib_request.Request(
-      url_endpoint,
-      data=data,
-      headers={"Content-Type": "application/json"},
-      method="POST"
-    )
-    with urllib_request.urlopen(req, timeout=10) as resp:
-      resp_body = resp.read()
-    parsed = json.loads(resp_body.decode("utf-8"))
-    candidates = parsed.get("candidates") or []
-    if not candidates:
-      return classify_tags_rule_based(title, url)
-    content = candidates[0].get("content") or {}
-    parts = content.get("parts") or []
-    if not parts:
-      return classify_tags_rule_based(title, url)
-    text = parts[0].get("text") or ""
-    # Split on whitespace and normalise.
-    tags = [t.strip().lower().lstrip("#") for t in text.split() if t.strip()]
-    # Deduplicate.
-    seen = set()
-    result = []
-    for t in tags:
-      if t and t not in seen:
-        seen.add(t)
-        result.append(t)
-    if not result:
-      return classify_tags_rule_based(title, url)
-    return result
-  except (urllib_error.URLError, urllib_error.HTTPError, TimeoutError, json.JSONDecodeError, KeyError):
+    text = gemini_generate_text(prompt)
+  except GEMINI_ERRORS:
     # On any failure, silently fall back to simple rules.
-    return classify_tags_rule_based(title, url)
+    return classify_tags_rule_based_batch(pairs)
+
+  tags_by_number: dict[int, list[str]] = {}
+  for line in text.splitlines():
+    match = BATCH_LINE_RE.match(line)
+    if match:
+      tags_by_number.setdefault(int(match.group(1)), parse_tags(match.group(2)))
+
+  results = [tags_by_number.get(n) or [] for n in range(1, len(pairs) + 1)]
+  missing = [i for i, tags in enumerate(results) if not tags]
+  if missing:
+    # The model did not answer for every entry: ask for those one at a time,
+    # concurrently, so the extra round-trips overlap instead of adding up.
+    with ThreadPoolExecutor(max_workers=min(GEMINI_MAX_WORKERS, len(missing))) as executor:
+      retried = executor.map(lambda i: classify_tags_ai(*pairs[i]), missing)
+      for i, tags in zip(missing, retried):
+        results[i] = tags
+  return results
+
+
+def classify_tags_none(pairs: list[tuple[str, str]]) -> list[list[str]]:
+  return [[] for _ in pairs]
+
+
+# The batch tagger for each TABVAULT_TAGS mode. It is picked once at import
+# time, so requests do not re-check the configuration per item.
+TAG_CLASSIFIERS = {
+  "ai": classify_tags_ai_batch,
+  "rule": classify_tags_rule_based_batch,
+  "off": classify_tags_none,
+}
+classify_items = TAG_CLASSIFIERS.get(TAGS_MODE, classify_tags_rule_based_batch)
+
+
+# In-memory copy of the markdown file, so a request does not have to re-read
+# and re-scan the whole vault note. The entry is validated against the file's
+# mtime and size, so edits made in Obsidian are picked up on the next request.
+#
+# "buf" holds the file's bytes without its final newline (i.e. its lines joined
+# by b"\n"), so entries can be spliced in place with a single bytearray insert.
+# "day_offsets" maps each day heading to the byte offset where its line starts.
+_CACHE = {
+  "mtime_ns": 0,
+  "size": 0,
+  "buf": None,
+  "ends_with_newline": False,
+  "day_offsets": {},
+}
+
+# Serializes access to the cache and the markdown file across server threads.
+MARKDOWN_LOCK = threading.Lock()
+
+
+# A `## <day>` heading line, with surrounding whitespace allowed.
+DAY_HEADING_RE = re.compile(rb"^[ \t\r\f\v]*## (.*?)[ \t\r\f\v]*$", re.MULTILINE)
+
+
+def index_day_headings(buf: bytearray) -> dict[str, int]:
+  """
+  Map each `## YYYY-MM-DD` heading to the byte offset of its line (first occurrence wins).
+  A single regex pass finds the headings, so no per-line objects are created.
+  """
+  day_offsets: dict[str, int] = {}
+  for match in DAY_HEADING_RE.finditer(buf):
+    day_offsets.setdefault(match.group(1).decode("utf-8", "replace"), match.start())
+  return day_offsets
+
+
+def load_markdown_buffer() -> bytearray:
+  """
+  Return the cached contents of the markdown file, re-reading it only when it
+  changed on disk since the last read or write.
+  """
+  st = os.stat(VAULT_MARKDOWN_PATH)
+  if _CACHE["buf"] is None or (st.st_mtime_ns, st.st_size) != (_CACHE["mtime_ns"], _CACHE["size"]):
+    # Read straight into a buffer sized from the stat result instead of
+    # copying a bytes object into a bytearray afterwards.
+    buf = bytearray(st.st_size)
+    with open(VAULT_MARKDOWN_PATH, "rb", buffering=0) as f:
+      del buf[f.readinto(buf):]
+      # Picks up anything appended between the stat and the read.
+      buf += f.read()
+    ends_with_newline = buf.endswith(b"\n")
+    if ends_with_newline:
+      del buf[-1:]
+    _CACHE["mtime_ns"] = st.st_mtime_ns
+    _CACHE["size"] = st.st_size
+    _CACHE["buf"] = buf
+    _CACHE["ends_with_newline"] = ends_with_newline
+    _CACHE["day_offsets"] = index_day_headings(buf)
+  return _CACHE["buf"]
+
+
+def find_insert_offset(buf: bytearray, heading_offset: int) -> int:
+  """
+  Return the offset of the first line after a heading that is neither an entry
+  (`- [`) nor blank. len(buf) + 1 means "after the last line".
+  """
+  pos = buf.find(b"\n", heading_offset) + 1
+  if pos == 0:
+    return len(buf) + 1
+  while pos <= len(buf):
+    end = buf.find(b"\n", pos)
+    if end == -1:
+      end = len(buf)
+    line = buf[pos:end]
+    if not (line.startswith(b"- [") or line.strip() == b""):
+      break
+    pos = end + 1
+  return pos
+
+
+def insert_block(buf: bytearray, pos: int, block: bytes) -> int:
+  """
+  Insert `block` (whole lines, each ending in b"\n") before the line starting
+  at `pos`; len(buf) + 1 appends it after the last line. Returns the number of
+  bytes inserted.
+  """
+  if pos > len(buf):
+    # buf carries no final newline, so the separator moves to the front.
+    block = block[:-1]
+    if buf:
+      block = b"\n" + block
+    buf += block
+  else:
+    buf[pos:pos] = block
+  return len(block)
 
 
 def append_items_to_markdown(items):
   if not items:
     return
 
-  ensure_file_exists()
-
-  # Read current file content.
-  with open(VAULT_MARKDOWN_PATH, "r", encoding="utf-8") as f:
-    existing = f.read()
-
-  lines = existing.splitlines()
+  # Tag every item up front so Gemini is asked once per request, not per item.
+  # This happens outside the write lock, so a slow model call does not hold up
+  # other requests.
+  pairs = []
+  for item in items:
+    url = item.get("url") or ""
+    title = item.get("title") or url or "Untitled"
+    pairs.append((title, url))
+  tags_per_item = classify_items(pairs)
 
-  # Group by closed date.
+  # Group by closed date; items without one are filed under today.
+  today = format_date_iso(int(time.time() * 1000))
   grouped = {}
-  for item in items:
+  for item, (title, url), tags in zip(items, pairs, tags_per_item):
     closed_at = item.get("closedAt") or item.get("closed_at") or 0
-    day = format_date_iso(closed_at) if closed_at else format_date_iso(int(datetime.now().timestamp() * 1000))
-    grouped.setdefault(day, []).append(item)
+    day = format_date_iso(closed_at) if closed_at else today
+    grouped.setdefault(day, []).append((title, url, tags))
 
-  for day, day_items in grouped.items():
-    heading = f"## {day}"
-    try:
-      idx = next(i for i, line in enumerate(lines) if line.strip() == heading)
-    except StopIteration:
-      # Add new day section at end.
-      if lines and lines[-1].strip() != "":
-        lines.append("")
-      lines.append(heading)
-      lines.append("")
-      idx = len(lines) - 2
+  with MARKDOWN_LOCK:
+    write_grouped_items(grouped)
 
-    insert_at = idx + 1
-    while insert_at < len(lines) and (lines[insert_at].startswith("- [") or lines[insert_at].strip() == ""):
-      insert_at += 1
 
-    new_lines = []
-    for item in day_items:
-      url = item.get("url") or ""
-      title = item.get("title") or url or "Untitled"
-      safe_title = escape_markdown_link_text(title)
-      tags = classify_tags_ai(title, url)
-      tags_suffix = ""
-      if tags:
-        tags_suffix = " " + " ".join(f"#{t}" for t in tags)
-
-      new_lines.append(f"- [ ] [{safe_title}]({url}){tags_suffix}")
-      new_lines.append("")
+def write_grouped_items(grouped: dict[str, list[tuple[str, str, list[str]]]]) -> None:
+  """
+  Insert (title, url, tags) entries under their `## YYYY-MM-DD` headings.
+  Must be called with MARKDOWN_LOCK held, since it updates the shared cache.
+  """
+  ensure_file_exists()
 
-    lines[insert_at:insert_at] = new_lines
+  buf = load_markdown_buffer()
+  day_offsets = _CACHE["day_offsets"]
+  ends_with_newline = _CACHE["ends_with_newline"]
+  # The buffer is modified in place below; drop it from the cache until the
+  # write succeeds so a failure can never leave it out of sync with the file.
+  _CACHE["buf"] = None
 
-  new_content = "\n".join(lines) + ("\n" if not existing.endswith("\n") else "")
+  # While every insertion lands at the end of the file, the existing content
+  # stays untouched and only the new bytes need to be written.
+  original_len = len(buf)
+  appended_only = True
 
-  with open(VAULT_MARKDOWN_PATH, "w", encoding="utf-8") as f:
-    f.write(new_content)
+  for day, day_items in grouped.items():
+    heading = f"## {day}".encode("utf-8")
+    offset = day_offsets.get(day)
+    if offset is None:
+      # Add new day section at end.
+      section = heading + b"\n\n"
+      if buf and buf[buf.rfind(b"\n") + 1:].strip() != b"":
+        section = b"\n" + section
+      insert_block(buf, len(buf) + 1, section)
+      offset = len(buf) - len(heading) - 1
+      day_offsets[day] = offset
+
+    insert_at = find_insert_offset(buf, offset)
+    if insert_at <= len(buf):
+      appended_only = False
+
+    # One string per entry (followed by a blank line), joined and encoded once.
+    block_parts = []
+    for title, url, tags in day_items:
+      tags_suffix = "".join(f" #{t}" for t in tags)
+      block_parts.append(f"- [ ] [{escape_markdown_link_text(title)}]({url}){tags_suffix}\n\n")
+    block = "".join(block_parts).encode("utf-8")
+
+    inserted = insert_block(buf, insert_at, block)
+    # Headings below the insertion point moved down.
+    for other_day, other_offset in day_offsets.items():
+      if other_offset >= insert_at:
+        day_offsets[other_day] = other_offset + inserted
+
+  # A final newline is only added when the file did not already end with one.
+  suffix = b"" if ends_with_newline else b"\n"
+  if appended_only and original_len:
+    # The old file is a prefix of the new one; write only what follows it.
+    with open(VAULT_MARKDOWN_PATH, "ab") as f:
+      f.write(buf[original_len + (1 if ends_with_newline else 0):] + suffix)
+  else:
+    # Write the new contents next to the note and swap them in, so a crash
+    # mid-write can never leave a truncated note behind. The real path is used
+    # so a symlinked note keeps pointing at the updated file.
+    target_path = os.path.realpath(VAULT_MARKDOWN_PATH)
+    tmp_path = target_path + ".tmp"
+    try:
+      with open(tmp_path, "wb") as f:
+        f.write(buf)
+        f.write(suffix)
+        f.flush()
+        os.fsync(f.fileno())
+      os.chmod(tmp_path, stat.S_IMODE(os.stat(target_path).st_mode))
+      os.replace(tmp_path, target_path)
+    except BaseException:
+      if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+      raise
+
+  # Keep the cache equal to what re-reading the file would produce.
+  ends_with_newline = bool(suffix) or buf.endswith(b"\n")
+  if not suffix and ends_with_newline:
+    del buf[-1:]
+  st = os.stat(VAULT_MARKDOWN_PATH)
+  _CACHE["mtime_ns"] = st.st_mtime_ns
+  _CACHE["size"] = st.st_size
+  _CACHE["buf"] = buf
+  _CACHE["ends_with_newline"] = ends_with_newline
 
 
 class RequestHandler(BaseHTTPRequestHandler):
+  # HTTP/1.1 keeps connections alive between requests from the extension.
+  protocol_version = "HTTP/1.1"
+
   def _send_json(self, status_code, payload):
-    body = json.dumps(payload).encode("utf-8")
+    body = json_dumps(payload)
     self.send_response(status_code)
     self.send_header("Content-Type", "application/json")
     self.send_header("Content-Length", str(len(body)))
+    if self.close_connection:
+      self.send_header("Connection", "close")
     self.end_headers()
     self.wfile.write(body)
 
   def do_POST(self):
     parsed = urlparse(self.path)
     if parsed.path != "/append":
+      # The body was not read, so the connection cannot be reused.
+      self.close_connection = True
       self._send_json(404, {"error": "Not found"})
       return
 
-    content_length = int(self.headers.get("Content-Length", "0") or "0")
+    try:
+      content_length = int(self.headers.get("Content-Length", "0") or "0")
+    except ValueError:
+      content_length = -1
+    if content_length < 0:
+      self.close_connection = True
+      self._send_json(400, {"error": "Invalid Content-Length"})
+      return
+    if content_length > MAX_BODY_BYTES:
+      self.close_connection = True
+      self._send_json(413, {"error": f"Request body too large (max {MAX_BODY_BYTES} bytes)"})
+      return
+
+    # The raw bytes go straight to the JSON parser, without an intermediate str.
     raw_body = self.rfile.read(content_length)
     try:
-      payload = json.loads(raw_body.decode("utf-8"))
+      payload = json_loads(raw_body)
       items = payload.get("items") or []
       if not isinstance(items, list):
         raise ValueError("items must be a list")
     except Exception as exc:
       self._send_json(400, {"error": f"Invalid JSON: {exc}"})
       return
+    if len(items) > MAX_ITEMS_PER_REQUEST:
+      self._send_json(413, {"error": f"Too many items (max {MAX_ITEMS_PER_REQUEST} per request)"})
+      return
 
     try:
       append_items_to_markdown(items)
@@ -275,7 +650,8 @@ class RequestHandler(BaseHTTPRequestHandler):
 def run_server(port: int = 8787):
   ensure_file_exists()
   server_address = ("127.0.0.1", port)
-  httpd = HTTPServer(server_address, RequestHandler)
+  httpd = ThreadingHTTPServer(server_address, RequestHandler)
+  httpd.daemon_threads = True
   print(f"Obsidian writer server listening on http://{server_address[0]}:{server_address[1]}/append")
   print(f"Writing to: {VAULT_MARKDOWN_PATH}")
   httpd.serve_forever()
@@ -289,5 +665,10 @@ if __name__ == "__main__":
       '  echo \'VAULT_MARKDOWN_PATH="/full/path/to/your/Obsidian/vault/Watch Later.md"\' > .env'
     )
   else:
+    if TAGS_MODE not in TAG_CLASSIFIERS:
+      print(
+        f"Unknown TABVAULT_TAGS value {TAGS_MODE!r}; expected one of: ai, rule, off.\n"
+        "Falling back to rule-based tags."
+      )
     run_server()
 